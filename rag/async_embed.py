@@ -0,0 +1,139 @@
+import json
+import time
+import asyncio
+import aiohttp
+import numpy as np
+
+# orjson parses the float-heavy embedding replies several times faster than json
+try:
+    from orjson import loads as _loads
+except ImportError:
+    _loads = json.loads
+
+# Gemini REST endpoints for batched and single embeddings; {model} is e.g. 'models/embedding-001'
+_BATCH_EMBED_URL = 'https://generativelanguage.googleapis.com/v1beta/{model}:batchEmbedContents'
+_EMBED_URL = 'https://generativelanguage.googleapis.com/v1beta/{model}:embedContent'
+
+# Times a batch is retried after a 429, waiting the server-provided retryDelay each time
+_MAX_RATE_LIMIT_RETRIES = 3
+
+# Status of a batch rejected as invalid (INVALID_ARGUMENT), typically because of one of its texts
+_INVALID_ARGUMENT = 400
+
+def _retry_delay(body, default=1.0):
+    # 429 bodies carry a google.rpc.RetryInfo detail such as {"retryDelay": "12s"}
+    try:
+        details = _loads(body)['error']['details']
+        for detail in details:
+            if 'retryDelay' in detail:
+                return float(detail['retryDelay'].rstrip('s'))
+    except (ValueError, KeyError, TypeError):
+        pass
+    return default
+
+class AsyncEmbedder:
+    """
+    Embeds text batches through the Gemini REST API from one aiohttp session, so every
+    batch reuses the same keep-alive connection pool. At most max_concurrency requests
+    are in flight at once, and each request first takes a slot from rate_limiter (a
+    rag.rate_limit.RateLimiter) when one is given. Request latencies and failures are reported
+    to batch_size_control (a rag.rate_limit.AdaptiveBatchSize) if one is given.
+    Use as `async with AsyncEmbedder(...) as embedder:`.
+    """
+    def __init__(self, api_key, model_name='models/embedding-001', max_concurrency=4, task_type='RETRIEVAL_DOCUMENT', rate_limiter=None, batch_size_control=None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.task_type = task_type
+        self.rate_limiter = rate_limiter
+        self.batch_size_control = batch_size_control
+        self.batch_url = _BATCH_EMBED_URL.format(model=model_name)
+        self.url = _EMBED_URL.format(model=model_name)
+        self.session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        # aiohttp sessions are bound to the running event loop, so they are created here
+        # rather than in __init__
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300),
+            headers={'x-goog-api-key': self.api_key},
+            timeout=aiohttp.ClientTimeout(total=60),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    def _record_failure(self):
+        if self.batch_size_control is not None:
+            self.batch_size_control.record_failure()
+
+    def _request(self, text):
+        return {'model': self.model_name, 'content': {'parts': [{'text': text}]}, 'taskType': self.task_type}
+
+    async def _post(self, url, payload, items):
+        # Rate-limited, concurrency-bounded POST that retries 429s after the server's retryDelay;
+        # items is the number of texts it embeds, for per-text latency
+        for attempt in range(_MAX_RATE_LIMIT_RETRIES + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.async_acquire()
+            async with self._semaphore:
+                start = time.perf_counter()
+                async with self.session.post(url, json=payload) as response:
+                    if response.status != 429 or attempt == _MAX_RATE_LIMIT_RETRIES:
+                        if response.status >= 400:
+                            self._record_failure()
+                        response.raise_for_status()
+                        data = _loads(await response.read())
+                        if self.batch_size_control is not None:
+                            self.batch_size_control.record_success(time.perf_counter() - start, items)
+                        return data
+                    self._record_failure()
+                    delay = _retry_delay(await response.read())
+            print(f"[DEBUG] Embedding request rate limited; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def embed_batch(self, batch):
+        """
+        Embeds up to 100 texts with a single batchEmbedContents request and returns
+        a (len(batch), dim) float32 array.
+        """
+        data = await self._post(self.batch_url, {'requests': [self._request(text) for text in batch]}, len(batch))
+        return np.asarray([embedding['values'] for embedding in data['embeddings']], dtype=np.float32)
+
+    async def embed_one(self, text):
+        """
+        Embeds a single text with an embedContent request and returns a float32 vector.
+        """
+        data = await self._post(self.url, self._request(text), 1)
+        return np.asarray(data['embedding']['values'], dtype=np.float32)
+
+    async def embed(self, chunks, batch_size):
+        """
+        Embeds chunks in concurrent batches of batch_size and returns a (len(chunks), dim)
+        float32 array. If a batch is rejected as invalid (e.g. because of one text), its
+        texts are retried individually and concurrently on the same session. Other errors
+        (429s that outlast the retries, 5xx, timeouts) are raised, since sending the texts
+        one by one would only multiply the failing requests.
+        """
+        out = None
+
+        async def run(start, batch):
+            nonlocal out
+            try:
+                vectors = await self.embed_batch(batch)
+            except aiohttp.ClientResponseError as e:
+                if e.status != _INVALID_ARGUMENT:
+                    raise
+                print(f"[DEBUG] Async batch embedding of {len(batch)} chunks failed ({e}); retrying one at a time")
+                vectors = np.stack(await asyncio.gather(*(self.embed_one(text) for text in batch)))
+            # Batches land directly in one preallocated matrix; its width is known from the first reply
+            if out is None:
+                out = np.empty((len(chunks), vectors.shape[1]), dtype=np.float32)
+            out[start:start + len(batch)] = vectors
+
+        await asyncio.gather(*(run(i, chunks[i:i + batch_size]) for i in range(0, len(chunks), batch_size)))
+        return out
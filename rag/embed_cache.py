@@ -0,0 +1,59 @@
+import os
+import hashlib
+import sqlite3
+import numpy as np
+
+# Persistent embedding cache: float32 vectors keyed by (SHA-256 of the text, model name).
+# Embeddings are deterministic for a given text and model, so entries never go stale.
+CACHE_PATH = os.path.join('cache', 'embeddings.sqlite3')
+
+# Keeps each IN (...) lookup well under SQLite's bound-parameter limit
+_LOOKUP_BATCH = 500
+
+def _connect(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path)
+    # WAL lets concurrent readers proceed while a writer appends
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS embeddings '
+        '(hash BLOB, model TEXT, vec BLOB, PRIMARY KEY (hash, model))'
+    )
+    return conn
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+def get_many(hashes, model_name, path=CACHE_PATH):
+    """
+    Returns {hash: float32 vector} for the hashes that are present in the cache.
+    """
+    found = {}
+    conn = _connect(path)
+    try:
+        for i in range(0, len(hashes), _LOOKUP_BATCH):
+            batch = hashes[i:i + _LOOKUP_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(
+                f'SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({placeholders})',
+                (model_name, *batch),
+            )
+            for h, vec in rows:
+                found[h] = np.frombuffer(vec, dtype=np.float32)
+    finally:
+        conn.close()
+    return found
+
+def put_many(vectors, model_name, path=CACHE_PATH):
+    """
+    Stores {hash: vector} entries for model_name, replacing any existing ones.
+    """
+    conn = _connect(path)
+    try:
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (hash, model, vec) VALUES (?, ?, ?)',
+                ((h, model_name, np.asarray(vec, dtype=np.float32).tobytes()) for h, vec in vectors.items()),
+            )
+    finally:
+        conn.close()
@@ -1,23 +1,176 @@
 import os
+import time
+import atexit
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+from .embed_cache import text_hash, get_many, put_many
+from .rate_limit import RateLimiter, AdaptiveBatchSize
 from dotenv import load_dotenv
 
+import google.generativeai as genai
+from google.api_core.exceptions import InvalidArgument
+
 # Explicitly load .env from the project root
 dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
-load_dotenv(dotenv_path)
+GOOGLE_API_KEY = None
+_CONFIGURED = False
 
-GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-print(f"[DEBUG] GOOGLE_API_KEY loaded: {str(GOOGLE_API_KEY)[:5]}..." if GOOGLE_API_KEY else "[DEBUG] GOOGLE_API_KEY not found!")
+# Loads .env and configures genai once per process, on first use rather than at import
+def ensure_configured():
+    global GOOGLE_API_KEY, _CONFIGURED
+    if _CONFIGURED:
+        return
+    load_dotenv(dotenv_path)
+    GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+    if not GOOGLE_API_KEY:
+        print("[DEBUG] GOOGLE_API_KEY not found!")
+    genai.configure(api_key=GOOGLE_API_KEY)
+    _CONFIGURED = True
 
-import google.generativeai as genai
-genai.configure(api_key=GOOGLE_API_KEY)
+# aiohttp is optional: without it, batches go through the genai client on a thread pool
+try:
+    from .async_embed import AsyncEmbedder
+except ImportError:
+    AsyncEmbedder = None
+
+# Gemini accepts up to 100 texts per batchEmbedContents request
+EMBED_BATCH_SIZE = 100
+EMBED_MAX_WORKERS = 4
+# Chunks per embed_text_chunks_stream step: enough to keep every worker busy with full batches
+EMBED_STREAM_GROUP_SIZE = EMBED_BATCH_SIZE * EMBED_MAX_WORKERS
+
+# Process-wide batch size used when callers don't pass one: starts at the API maximum,
+# halves on failures/429s and grows back while latency stays healthy
+_BATCH_SIZE = AdaptiveBatchSize(EMBED_BATCH_SIZE, max_size=EMBED_BATCH_SIZE)
+
+# Requests per minute allowed per embedding model; calls are paced to stay under it
+EMBED_REQUESTS_PER_MINUTE = 1500
+_LIMITERS = {}
+
+def _limiter(model_name):
+    # setdefault keeps a single limiter per model even if threads race here
+    return _LIMITERS.get(model_name) or _LIMITERS.setdefault(model_name, RateLimiter(EMBED_REQUESTS_PER_MINUTE, 60))
+
+def _embed_batch(batch, model_name):
+    limiter = _limiter(model_name)
+    try:
+        # A list `content` is sent as a single batchEmbedContents call
+        limiter.acquire()
+        start = time.perf_counter()
+        response = genai.embed_content(model=model_name, content=batch, task_type="retrieval_document")
+        _BATCH_SIZE.record_success(time.perf_counter() - start, len(batch))
+        return np.asarray(response['embedding'], dtype=np.float32)
+    except Exception as e:
+        _BATCH_SIZE.record_failure()
+        # One bad text fails the whole batch; retry item by item so the rest still embed.
+        # Anything else (429s, 5xx, timeouts) would only fail again once per text.
+        if not isinstance(e, InvalidArgument):
+            raise
+        print(f"[DEBUG] Batch embedding of {len(batch)} chunks failed ({e}); retrying one at a time")
+        embeddings = []
+        for chunk in batch:
+            limiter.acquire()
+            embeddings.append(genai.embed_content(model=model_name, content=chunk, task_type="retrieval_document")['embedding'])
+        return np.asarray(embeddings, dtype=np.float32)
 
 # Embed a list of text chunks using Gemini embedding model (not generation model)
-def embed_text_chunks(chunks, model_name='models/embedding-001'):
+def embed_text_chunks(chunks, model_name='models/embedding-001', batch_size=None, max_workers=EMBED_MAX_WORKERS, use_cache=True):
+    """
+    Returns a float32 array of shape (len(chunks), dim) holding the Gemini embedding of each chunk.
+    Chunks already in the on-disk embedding cache are not sent to the API; the rest are sent in
+    batches of batch_size, with up to max_workers batches in flight, and written back to the cache.
+    batch_size defaults to the adaptively tuned process-wide size.
+    """
+    ensure_configured()
+    if batch_size is None:
+        batch_size = _BATCH_SIZE.size
+    if not use_cache:
+        return _embed_uncached(chunks, model_name, batch_size, max_workers)
+    hashes = [text_hash(chunk) for chunk in chunks]
+    cached = get_many(hashes, model_name)
+    missing = [i for i, h in enumerate(hashes) if h not in cached]
+    fresh = _embed_uncached([chunks[i] for i in missing], model_name, batch_size, max_workers)
+    if missing:
+        put_many({hashes[i]: fresh[j] for j, i in enumerate(missing)}, model_name)
+    if not cached:
+        return fresh
+    dim = len(next(iter(cached.values())))
+    out = np.empty((len(chunks), dim), dtype=np.float32)
+    for i, h in enumerate(hashes):
+        if h in cached:
+            out[i] = cached[h]
+    if missing:
+        out[missing] = fresh
+    return out
+
+def embed_text_chunks_stream(chunks, model_name='models/embedding-001', group_size=EMBED_STREAM_GROUP_SIZE):
+    """
+    Yields (start, embeddings) for consecutive groups of group_size chunks, each embedded
+    with embed_text_chunks. A caller can index one group while the next is being embedded.
+    """
+    for start in range(0, len(chunks), group_size):
+        yield start, embed_text_chunks(chunks[start:start + group_size], model_name=model_name)
+
+def _embed_uncached(chunks, model_name, batch_size, max_workers):
+    if AsyncEmbedder is not None and chunks:
+        embedder = _async_embedder(model_name, max_workers)
+        return asyncio.run_coroutine_threadsafe(embedder.embed(chunks, batch_size), _LOOP).result()
+    return _embed_threaded(chunks, model_name, batch_size, max_workers)
+
+# Async embedding runs on one event loop in a background thread, with one AsyncEmbedder
+# (one aiohttp session and connection pool) per model kept open for the life of the
+# process, so every call, down to a single query, reuses warm keep-alive connections
+_LOOP = None
+_EMBEDDERS = {}
+_EMBEDDERS_LOCK = threading.Lock()
+
+def _async_embedder(model_name, max_concurrency):
+    global _LOOP
+    with _EMBEDDERS_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name='embed-loop', daemon=True).start()
+            atexit.register(_close_embedders)
+        key = (model_name, max_concurrency)
+        if key not in _EMBEDDERS:
+            embedder = AsyncEmbedder(
+                GOOGLE_API_KEY, model_name, max_concurrency=max_concurrency,
+                rate_limiter=_limiter(model_name), batch_size_control=_BATCH_SIZE,
+            )
+            # The session has to be opened on the loop that will use it
+            asyncio.run_coroutine_threadsafe(embedder.__aenter__(), _LOOP).result()
+            _EMBEDDERS[key] = embedder
+        return _EMBEDDERS[key]
+
+def _close_embedders():
+    for embedder in _EMBEDDERS.values():
+        asyncio.run_coroutine_threadsafe(embedder.__aexit__(None, None, None), _LOOP).result()
+    _LOOP.call_soon_threadsafe(_LOOP.stop)
+
+def _embed_threaded(chunks, model_name, batch_size, max_workers):
+    batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+    if len(batches) <= 1:
+        return _embed_batch(batches[0], model_name) if batches else np.empty((0, 0), dtype=np.float32)
+    out = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i, batch_embeddings in enumerate(executor.map(lambda b: _embed_batch(b, model_name), batches)):
+            # The embedding width is only known once the first batch comes back
+            if out is None:
+                out = np.empty((len(chunks), batch_embeddings.shape[1]), dtype=np.float32)
+            start = i * batch_size
+            out[start:start + len(batch_embeddings)] = batch_embeddings
+    return out
+
+@lru_cache(maxsize=2048)
+def embed_query(text, model_name='models/embedding-001'):
     """
-    Returns a list of embedding vectors for the given text chunks using Gemini embedding model.
+    Returns the embedding of a single query as a read-only float32 vector.
+    Results are memoized in-process in front of the on-disk cache, so a repeated
+    query costs neither an API call nor a SQLite lookup.
     """
-    embeddings = []
-    for chunk in chunks:
-        response = genai.embed_content(model=model_name, content=chunk, task_type="retrieval_document")
-        embeddings.append(response['embedding'])
-    return embeddings 
\ No newline at end of file
+    embedding = embed_text_chunks([text], model_name=model_name)[0]
+    embedding.flags.writeable = False
+    return embedding
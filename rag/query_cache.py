@@ -0,0 +1,53 @@
+import threading
+from collections import deque
+import faiss
+import numpy as np
+
+class SemanticQueryCache:
+    """
+    Remembers answers by query embedding. get() returns the answer stored for the most
+    similar earlier query if its cosine similarity is at least threshold, so repeated and
+    reworded questions skip retrieval and generation. Holds at most max_entries answers,
+    dropping the oldest first.
+    """
+    def __init__(self, dim, max_entries=1024, threshold=0.95):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.index = faiss.IndexIDMap(faiss.IndexFlatIP(self.dim))
+            self._answers = {}
+            self._order = deque()
+            self._next_id = 0
+
+    def _normalized(self, embedding):
+        arr = np.array(embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(arr)
+        return arr
+
+    def get(self, embedding):
+        arr = self._normalized(embedding)
+        with self._lock:
+            if not self._answers:
+                return None
+            D, I = self.index.search(arr, 1)
+            if I[0][0] < 0 or D[0][0] < self.threshold:
+                return None
+            return self._answers[int(I[0][0])]
+
+    def put(self, embedding, answer):
+        arr = self._normalized(embedding)
+        with self._lock:
+            if len(self._order) >= self.max_entries:
+                oldest = self._order.popleft()
+                self.index.remove_ids(np.array([oldest], dtype=np.int64))
+                del self._answers[oldest]
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(arr, np.array([entry_id], dtype=np.int64))
+            self._answers[entry_id] = answer
+            self._order.append(entry_id)
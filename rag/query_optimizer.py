@@ -1,10 +1,11 @@
-import os
-from dotenv import load_dotenv
+from functools import lru_cache
 import google.generativeai as genai
+from .embedder import ensure_configured
 
-load_dotenv()
-GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-genai.configure(api_key=GOOGLE_API_KEY)
+# GenerativeModel instances are reused across calls instead of rebuilt per query
+@lru_cache(maxsize=4)
+def _get_model(model_name):
+    return genai.GenerativeModel(model_name)
 
 # uses gemini LLM to optimize the user query. 
 def optimize_query(query, system_prompt=None, model_name='models/gemini-1.5-flash'):
@@ -12,9 +13,9 @@ def optimize_query(query, system_prompt=None, model_name='models/gemini-1.5-flas
     Uses Gemini 1.5 Flash (generation model) to optimize/refine the user query for better retrieval.
     Optionally accepts a system prompt for context.
     """
+    ensure_configured()
     prompt = f"Optimize the following query for information retrieval: {query}"
     if system_prompt:
         prompt = system_prompt + "\n" + prompt
-    model = genai.GenerativeModel(model_name)
-    response = model.generate_content(prompt)
+    response = _get_model(model_name).generate_content(prompt)
     return response.text.strip() 
@@ -1,25 +1,156 @@
-from .document_loader import load_document
+import os
+import glob
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .document_loader import resolve_document, extract_text
 from .text_splitter import split_text
-from .embedder import embed_text_chunks
+from .embedder import embed_text_chunks, embed_text_chunks_stream, embed_query, ensure_configured
 from .vector_store import FaissVectorStore
 from .query_optimizer import optimize_query
 from .retriever import retrieve_relevant_chunks
+from .query_cache import SemanticQueryCache
 import google.generativeai as genai
 
+# Static part of the answer prompt. It is kept byte-identical and first in every prompt so
+# provider-side prompt caching can reuse it; only the context and question vary.
+_SYS_PREFIX = (
+    "You are an expert assistant. Based on the context below, answer the question with:\n"
+    "- A direct and concise answer\n"
+    "- Cite specific lines from the context\n"
+    "- Avoid information not present in the context\n"
+    "\n"
+    "Context:\n"
+)
+
+# Upper bound on concurrent answer_query calls made by aanswer_queries
+MAX_CONCURRENT_QUERIES = 8
+
+# Each cached document is a set of files sharing its content-hash prefix
+def _remove_cached_document(cache_dir, key):
+    for path in glob.glob(os.path.join(cache_dir, key + '.*')):
+        os.remove(path)
+
+# Drops the least recently used documents from the cache directory, keeping max_entries
+def _evict_cached_documents(cache_dir, max_entries):
+    indexes = sorted(glob.glob(os.path.join(cache_dir, '*.faiss')), key=os.path.getmtime, reverse=True)
+    for index_path in indexes[max_entries:]:
+        _remove_cached_document(cache_dir, os.path.splitext(os.path.basename(index_path))[0])
+
+# Collapses exact duplicate chunks (repeated headers, footers, boilerplate) so each is
+# embedded once. Returns (unique_chunks, mapping) with chunks[i] == unique_chunks[mapping[i]].
+def _dedup_chunks(chunks):
+    positions = {}
+    unique = []
+    mapping = []
+    for chunk in chunks:
+        idx = positions.setdefault(chunk, len(unique))
+        if idx == len(unique):
+            unique.append(chunk)
+        mapping.append(idx)
+    return unique, mapping
+
 # Main RAG pipeline using Gemini 1.5 Flash for generation and embedding-001 for embeddings
 class RAGPipeline:
-    def __init__(self, embedding_dim=768):
+    def __init__(self, embedding_dim=768, cache_dir='cache', max_cached_documents=16):
         self.embedding_dim = embedding_dim
-        self.vector_store = FaissVectorStore(dim=embedding_dim)
+        self.cache_dir = cache_dir
+        self.max_cached_documents = max_cached_documents
+        self.vector_store = None
+        self.document_hash = None
         self.chunks = []
+        # vector_store, chunks and document_hash change together when a document is ingested;
+        # queries read them under this lock so they never pair one document's store with
+        # another's chunks
+        self._document_lock = threading.Lock()
         self.embedding_model = 'models/embedding-001'
         self.generation_model = 'models/gemini-1.5-flash'
+        ensure_configured()
+        # USE_HNSW=1 (environment or .env) indexes new documents with an HNSW graph instead
+        # of a flat scan; flat is exact and fast enough for a typical document's chunk count
+        self.index_type = 'hnsw' if os.getenv('USE_HNSW', '0') == '1' else 'flat'
+        self._gen_model = genai.GenerativeModel(self.generation_model)
+        # Answers for the loaded document, looked up by optimized query embedding
+        self._query_cache = SemanticQueryCache(embedding_dim)
 
     def ingest_document(self, link):
-        text, _ = load_document(link)
-        self.chunks = split_text(text)
-        embeddings = embed_text_chunks(self.chunks, model_name=self.embedding_model)
-        self.vector_store.add(embeddings, self.chunks)
+        """
+        Loads, chunks and embeds the document. Indexes are cached under cache_dir keyed by
+        the SHA-256 of the file contents, so a document seen before (under any link) is
+        loaded from disk without re-parsing or re-embedding, and re-ingesting the document
+        that is already loaded is a no-op.
+        """
+        local_path, key = resolve_document(link)
+        if key == self.document_hash:
+            # Same content as the document already loaded; nothing to do
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        index_path = os.path.join(self.cache_dir, key + '.faiss')
+        # The new store is filled before it is published, so queries running meanwhile keep
+        # answering from the previous document
+        vector_store = self._open_store(key)
+        if len(vector_store.meta) != vector_store.index.ntotal or not vector_store.meta.intact():
+            # Texts saved without their index or offsets: a write of this document was interrupted
+            print("[DEBUG] Cached index is incomplete; rebuilding it")
+            vector_store = None  # release its memory maps before deleting the files
+            _remove_cached_document(self.cache_dir, key)
+            vector_store = self._open_store(key)
+        if vector_store.index.ntotal:
+            # The memory-mapped texts serve as the chunk list; each chunk is decoded on access
+            chunks = vector_store.meta
+            os.utime(index_path)
+        else:
+            text = extract_text(local_path)
+            chunks = split_text(text, strategy='recursive')
+            with vector_store:
+                self._index_chunks(vector_store, chunks)
+        with self._document_lock:
+            self.vector_store = vector_store
+            self.chunks = chunks
+            self.document_hash = key
+            self._query_cache.clear()
+        _evict_cached_documents(self.cache_dir, self.max_cached_documents)
+
+    def _open_store(self, key):
+        return FaissVectorStore(
+            dim=self.embedding_dim,
+            index_path=os.path.join(self.cache_dir, key + '.faiss'),
+            meta_path=os.path.join(self.cache_dir, key + '.meta'),
+            index_type=self.index_type,
+        )
+
+    def _index_chunks(self, vector_store, chunks):
+        # Embeds the unique chunks group by group and adds each finished stretch of
+        # chunks to the store on a worker thread, so FAISS indexing overlaps the
+        # embedding requests for the next group.
+        unique_chunks, mapping = _dedup_chunks(chunks)
+        mapping = np.asarray(mapping)
+        # Unique ids are assigned in order of first occurrence, so once the first u unique
+        # chunks are embedded, every chunk before the first occurrence of unique u can be added
+        first_seen = np.unique(mapping, return_index=True)[1]
+        unique_embeddings = None
+        added = 0
+        futures = []
+        with ThreadPoolExecutor(max_workers=1) as indexer:
+            for start, embeddings in embed_text_chunks_stream(unique_chunks, model_name=self.embedding_model):
+                if unique_embeddings is None:
+                    unique_embeddings = np.empty((len(unique_chunks), embeddings.shape[1]), dtype=np.float32)
+                done = start + len(embeddings)
+                unique_embeddings[start:done] = embeddings
+                stop = first_seen[done] if done < len(unique_chunks) else len(chunks)
+                futures.append(indexer.submit(
+                    vector_store.add, unique_embeddings[mapping[added:stop]], chunks[added:stop],
+                ))
+                added = stop
+        for future in futures:
+            future.result()
+
+    def embed_queries(self, queries):
+        """
+        Embeds several queries in one batched call; returns a (len(queries), dim) float32 array.
+        """
+        return embed_text_chunks(queries, model_name=self.embedding_model)
 
     def answer_query(self, query):
         """
@@ -27,22 +158,70 @@ class RAGPipeline:
         """
         # Use generation model for query optimization
         optimized_query = optimize_query(query, model_name=self.generation_model)
-        # Use embedding model for retrieval
-        references = retrieve_relevant_chunks(optimized_query, self.vector_store, self.chunks, model_name=self.embedding_model)
-        context = '\n'.join(chunk for _, chunk in references)
+        return self.answer_query_with_embedding(optimized_query, embed_query(optimized_query, model_name=self.embedding_model))
+
+    def answer_query_with_embedding(self, optimized_query, query_embedding):
+        """
+        Like answer_query, but for an already optimized query whose embedding was computed
+        up front (see embed_queries), so no embedding call is made here.
+        A query close enough to one answered before returns the earlier answer.
+        """
+        with self._document_lock:
+            vector_store, chunks, document_hash = self.vector_store, self.chunks, self.document_hash
+        cached = self._query_cache.get(query_embedding)
+        if cached is not None:
+            return cached
+        references = retrieve_relevant_chunks(
+            optimized_query, vector_store, chunks,
+            model_name=self.embedding_model, query_embedding=query_embedding,
+        )
+        # One join builds the whole prompt, with no intermediate context string
+        parts = [_SYS_PREFIX]
+        for _, chunk in references:
+            parts.append(chunk)
+            parts.append('\n')
+        parts.append("\nQuestion: ")
+        parts.append(optimized_query)
+        parts.append("\nAnswer:\n")
+        prompt = ''.join(parts)
         # Generate answer using Gemini 1.5 Flash
-        prompt = f"""
-You are an expert assistant. Based on the context below, answer the question with:
-- A direct and concise answer
-- Cite specific lines from the context
-- Avoid information not present in the context
-
-Context:
-{context}
-
-Question: {optimized_query}
-Answer:
-"""
-        model = genai.GenerativeModel(self.generation_model)
-        response = model.generate_content(prompt)
-        return response.text.strip(), references 
+        response = self._gen_model.generate_content(prompt)
+        result = (response.text.strip(), references)
+        with self._document_lock:
+            # Don't cache an answer about a document replaced while it was being generated
+            if self.document_hash == document_hash:
+                self._query_cache.put(query_embedding, result)
+        return result
+
+    # Async entry points for FastAPI-style callers. Download, PDF parsing and the
+    # Gemini calls are all blocking, so they run in a worker thread to keep the
+    # event loop free while the network is busy.
+    async def aingest_document(self, link):
+        await asyncio.to_thread(self.ingest_document, link)
+
+    async def aanswer_query(self, query):
+        """
+        Async variant of answer_query; returns the same (answer, references) tuple.
+        """
+        return await asyncio.to_thread(self.answer_query, query)
+
+    async def aanswer_queries(self, queries, max_concurrency=MAX_CONCURRENT_QUERIES):
+        """
+        Answers several queries concurrently, returning (answer, references) tuples in input order.
+        At most max_concurrency queries are in flight to stay within Gemini rate limits.
+        All optimized queries are embedded together in one batched call.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(fn, *args):
+            async with semaphore:
+                return await asyncio.to_thread(fn, *args)
+
+        optimized_queries = await asyncio.gather(
+            *(run(optimize_query, query, None, self.generation_model) for query in queries)
+        )
+        query_embeddings = await asyncio.to_thread(self.embed_queries, list(optimized_queries))
+        return list(await asyncio.gather(
+            *(run(self.answer_query_with_embedding, query, embedding)
+              for query, embedding in zip(optimized_queries, query_embeddings))
+        ))
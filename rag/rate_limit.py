@@ -0,0 +1,71 @@
+import time
+import asyncio
+import threading
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate` calls per `period` seconds, shared by threads and
+    event loops alike. Callers block (acquire) or await (async_acquire) until their
+    slot comes up, so requests are paced instead of bursting into 429s.
+    """
+    def __init__(self, rate, period=60.0):
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # Takes a token (possibly going into debt) and returns how long to wait for it
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.period)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens * self.period / self.rate
+
+    def acquire(self):
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def async_acquire(self):
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+class AdaptiveBatchSize:
+    """
+    Tunes a request batch size from observed API behaviour. A full-size request whose
+    per-text latency is clearly below the running (EWMA) figure grows the size by 25%, up
+    to max_size; a failed or rate-limited request halves it, down to min_size. Smaller
+    requests (single-text fallbacks and queries, a short final batch) are not measured.
+    """
+    def __init__(self, size, min_size=8, max_size=100, alpha=0.2):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.alpha = alpha
+        # Seconds per text
+        self.ewma_latency = None
+        self._lock = threading.Lock()
+
+    def record_success(self, seconds, items):
+        # A one-text request always finishes fast, so it says nothing about how a full
+        # batch is coping; per-text time keeps batches of 50 and 100 comparable
+        with self._lock:
+            if items < self.size:
+                return
+            seconds /= items
+            if self.ewma_latency is None:
+                self.ewma_latency = seconds
+                return
+            if seconds < 0.9 * self.ewma_latency:
+                self.size = min(self.max_size, int(self.size * 1.25))
+            self.ewma_latency = self.alpha * seconds + (1 - self.alpha) * self.ewma_latency
+
+    def record_failure(self):
+        with self._lock:
+            self.size = max(self.min_size, self.size // 2)
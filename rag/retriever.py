@@ -1,13 +1,17 @@
-import numpy as np
-from .embedder import embed_text_chunks
+from .embedder import embed_query
 
-def retrieve_relevant_chunks(query, vector_store, all_chunks, model_name='models/embedding-001', top_k=5):
+def retrieve_relevant_chunks(query, vector_store, all_chunks, model_name='models/embedding-001', top_k=5, query_embedding=None):
     """
     Embeds the query using Gemini embedding model, searches the FAISS vector store, and returns a list of (index, chunk) tuples for valid references.
+    Pass query_embedding to reuse an embedding computed earlier (e.g. in a batch) and skip the API call.
     """
-    query_embedding = embed_text_chunks([query], model_name=model_name)[0]
-    query_embedding = np.array(query_embedding, dtype='float32').reshape(1, -1)
-    indices = vector_store.index.search(query_embedding, top_k)[1][0]
-    # Return (index, chunk) for valid indices
-    valid_refs = [(i, all_chunks[i]) for i in indices if 0 <= i < len(all_chunks)]
+    # Every chunk would be returned anyway; skip the embedding call and the search and
+    # hand them back in document order
+    if top_k >= len(all_chunks):
+        return list(enumerate(all_chunks))
+    if query_embedding is None:
+        query_embedding = embed_query(query, model_name=model_name)
+    # The store hands back row indices, which double as positions in all_chunks
+    indices = vector_store.search_ids(query_embedding, top_k)
+    valid_refs = [(i, all_chunks[i]) for i in indices if i < len(all_chunks)]
     return valid_refs 
\ No newline at end of file
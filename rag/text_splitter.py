@@ -1,12 +1,83 @@
-def split_text(text, chunk_size=500, overlap=50):
+import re
+
+_PARAGRAPH_RE = re.compile(r'\n\s*\n')
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+_WORD_RE = re.compile(r'\S+')
+
+# Chunks are sliced out of text by word offsets, so only the chunks are materialized
+# rather than one string per word. Whitespace inside a chunk is kept as in the source.
+def _split_by_words(text, chunk_size, overlap):
+    starts = []
+    ends = []
+    for match in _WORD_RE.finditer(text):
+        starts.append(match.start())
+        ends.append(match.end())
+    chunks = []
+    for i in range(0, len(starts), chunk_size - overlap):
+        chunks.append(text[starts[i]:ends[min(i + chunk_size, len(ends)) - 1]])
+    return chunks
+
+def _split_by_paragraphs(text):
+    return _PARAGRAPH_RE.split(text)
+
+def _split_by_lines(text):
+    return text.split('\n')
+
+def _split_by_sentences(text):
+    return _SENTENCE_RE.split(text)
+
+# Separators tried in order by the recursive strategy, coarsest first
+_SEPARATORS = (_split_by_paragraphs, _split_by_lines, _split_by_sentences)
+
+# Greedily packs pieces into chunks of at most chunk_size words, carrying up to
+# `overlap` words of trailing pieces into the next chunk as long as the incoming
+# piece still fits alongside them
+def _merge_pieces(pieces, chunk_size, overlap):
+    chunks = []
+    current = []
+    current_words = 0
+    for piece in pieces:
+        n = len(piece.split())
+        if current and current_words + n > chunk_size:
+            chunks.append(' '.join(current))
+            # Count how many trailing pieces fit in the overlap, then take them as one slice
+            keep = 0
+            carried = 0
+            for prev in reversed(current):
+                m = len(prev.split())
+                if carried + m > overlap or carried + m + n > chunk_size:
+                    break
+                keep += 1
+                carried += m
+            current, current_words = current[len(current) - keep:], carried
+        current.append(piece)
+        current_words += n
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+def _split_recursive(text, chunk_size, overlap, separators):
+    if len(text.split()) <= chunk_size:
+        text = ' '.join(text.split())
+        return [text] if text else []
+    if not separators:
+        return _split_by_words(text, chunk_size, overlap)
+    pieces = []
+    for part in separators[0](text):
+        pieces.extend(_split_recursive(part, chunk_size, overlap, separators[1:]))
+    return _merge_pieces(pieces, chunk_size, overlap)
+
+def split_text(text, chunk_size=500, overlap=50, strategy='words'):
     """
-    Splits text into chunks of chunk_size with overlap.
+    Splits text into chunks of at most chunk_size words with overlap.
+    strategy='words' cuts a fixed word window; strategy='recursive' splits on
+    paragraphs, then lines, then sentences (falling back to words) and packs the
+    pieces back together, so chunks follow the document structure and fewer of
+    them are needed.
     Returns a list of text chunks.
     """
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i+chunk_size])
-        if chunk:
-            chunks.append(chunk)
-    return chunks 
\ No newline at end of file
+    if strategy == 'words':
+        return _split_by_words(text, chunk_size, overlap)
+    if strategy == 'recursive':
+        return _split_recursive(text, chunk_size, overlap, _SEPARATORS)
+    raise ValueError(f"Unsupported split strategy '{strategy}'. Expected 'words' or 'recursive'.")
@@ -1,34 +1,581 @@
 import faiss
 import numpy as np
 import os
-import pickle
+import math
+import threading
+from contextlib import contextmanager
+
+# Scalar quantizer types for compressed vector storage; 'fp32' keeps a flat index
+_SCALAR_QUANTIZERS = {
+    'sq8': faiss.ScalarQuantizer.QT_8bit,
+    'sq4': faiss.ScalarQuantizer.QT_4bit,
+    'fp16': faiss.ScalarQuantizer.QT_fp16,
+    'bf16': faiss.ScalarQuantizer.QT_bf16,
+}
+
+# IVF-PQ layout: PQ sub-quantizers (at most; must divide dim), bits per code, cells probed per query.
+# Training wants ~256 points per cell, so the index is only built once the corpus is that large.
+_PQ_M = 64
+_PQ_NBITS = 8
+_IVF_NPROBE = 16
+_IVF_POINTS_PER_CELL = 256
+
+# Index types built lazily from a flat staging index. 'ivfpq_fastscan' uses 4-bit codes
+# packed for the SIMD shuffle (pshufb/AVX-512) distance kernels.
+_IVF_INDEX_TYPES = ('ivfpq', 'ivfpq_fastscan')
+_FASTSCAN_NBITS = 4
+
+# With rerank=True, candidates fetched from the index per requested result
+_RERANK_CANDIDATES = 4
+# Below this many vectors, stores holding FP32 vectors skip FAISS and scan them directly
+_SMALL_N_THRESHOLD = 256
+# Rows preallocated in a new FP32 vectors file; it doubles from there
+_MIN_VECTOR_CAPACITY = 1024
+
+# HNSW graph: links per node, build-time and query-time candidate list sizes
+_HNSW_M = 32
+_HNSW_EF_CONSTRUCTION = 200
+_HNSW_EF_SEARCH = 64
+
+# Loads indexes read-only with their vector codes memory-mapped instead of copied into
+# RAM (IO_FLAG_MMAP_IFC, faiss >= 1.11), so the OS pages them in on demand and processes
+# share them. Older builds only map IVF inverted lists stored on disk.
+if hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+    _MMAP_FLAG = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+else:
+    _MMAP_FLAG = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+_CONFIGURED = False
+
+# FAISS parallelizes add/search/training with OpenMP. The pool is sized to the CPUs this
+# process may run on (its affinity mask, not the host's core count); FAISS_THREADS
+# overrides it, e.g. FAISS_THREADS=1 when many single-query searches run concurrently.
+def _faiss_threads():
+    if os.getenv('FAISS_THREADS'):
+        return int(os.getenv('FAISS_THREADS'))
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+# Runs once per process, on the first store. faiss picks its AVX2/AVX-512/SVE build at
+# import; with FAISS_DEBUG=1 the one in use is reported, so a slow generic build is easy to spot.
+def _configure_faiss():
+    global _CONFIGURED
+    if _CONFIGURED:
+        return
+    _CONFIGURED = True
+    threads = _faiss_threads()
+    faiss.omp_set_num_threads(threads)
+    if os.getenv('FAISS_DEBUG', '0') == '1':
+        print(f"[DEBUG] faiss compile options: {faiss.get_compile_options().strip()}; {threads} threads")
+
+# faiss-gpu builds expose StandardGpuResources; faiss-cpu does not
+def _gpu_available():
+    return hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0
+
+def _ivf_nlist(n):
+    return max(4, int(math.sqrt(n)))
+
+def _pq_m(dim):
+    m = _PQ_M
+    while dim % m:
+        m -= 1
+    return m
+
+def _build_index(dim, quantization, index_type):
+    if index_type in _IVF_INDEX_TYPES:
+        # IVF-PQ cannot be trained on an empty corpus; vectors are staged in a flat
+        # index and moved over by FaissVectorStore._maybe_build_ivfpq.
+        return faiss.IndexFlatIP(dim)
+    if index_type not in ('flat', 'hnsw'):
+        raise ValueError(f"Unsupported index_type '{index_type}'. Expected 'flat', 'hnsw', 'ivfpq' or 'ivfpq_fastscan'.")
+    if quantization != 'fp32' and quantization not in _SCALAR_QUANTIZERS:
+        raise ValueError(
+            f"Unsupported quantization '{quantization}'. "
+            f"Expected 'fp32' or one of {sorted(_SCALAR_QUANTIZERS)}."
+        )
+    if index_type == 'hnsw':
+        if quantization == 'fp32':
+            index = faiss.IndexHNSWFlat(dim, _HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            # Graph over scalar-quantized codes; sq8/sq4 train their ranges on the first add
+            index = faiss.IndexHNSWSQ(dim, _SCALAR_QUANTIZERS[quantization], _HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = _HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = _HNSW_EF_SEARCH
+        return index
+    if quantization == 'fp32':
+        index = faiss.IndexFlatIP(dim)
+    else:
+        index = faiss.IndexScalarQuantizer(dim, _SCALAR_QUANTIZERS[quantization], faiss.METRIC_INNER_PRODUCT)
+    # Explicit ids keep row numbers stable when vectors are removed (see FaissVectorStore.remove)
+    return faiss.IndexIDMap2(index)
+
+class _ReadWriteLock:
+    """
+    Lets any number of readers in at once, or a single writer alone. A waiting writer
+    holds back new readers, so a steady stream of searches cannot starve an add.
+    Not reentrant.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+class MappedTextList:
+    """
+    Append-only list of strings stored as one UTF-8 blob (<path>.texts) plus int64 end
+    offsets (<path>.offsets). Saved entries are read through np.memmap, so opening a
+    store doesn't load the corpus into RAM; item i is decoded from its byte range on access.
+    """
+    def __init__(self, path):
+        self.texts_path = path + '.texts'
+        self.offsets_path = path + '.offsets'
+        self._pending = []
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.offsets_path):
+            self._offsets = np.memmap(self.offsets_path, dtype=np.int64, mode='r')
+        else:
+            self._offsets = np.zeros(1, dtype=np.int64)
+        # np.memmap refuses empty files
+        if self._offsets[-1] > 0:
+            self._texts = np.memmap(self.texts_path, dtype=np.uint8, mode='r')
+        else:
+            self._texts = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self._offsets) - 1 + len(self._pending)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.take(np.arange(*i.indices(len(self))))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('MappedTextList index out of range')
+        saved = len(self._offsets) - 1
+        if i >= saved:
+            return self._pending[i - saved]
+        return self._texts[self._offsets[i]:self._offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return iter(self.take(np.arange(len(self))))
+
+    def take(self, ids):
+        """
+        Returns the entries at the given indices as a list. The byte ranges of saved entries
+        are gathered with one fancy-indexing step over the offsets rather than per item.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        saved = len(self._offsets) - 1
+        in_saved = ids[ids < saved]
+        bounds = zip(self._offsets[in_saved].tolist(), self._offsets[in_saved + 1].tolist())
+        texts = []
+        for i in ids.tolist():
+            if i < saved:
+                start, end = next(bounds)
+                texts.append(self._texts[start:end].tobytes().decode('utf-8'))
+            else:
+                texts.append(self[i])
+        return texts
+
+    def extend(self, texts):
+        self._pending.extend(texts)
+
+    def intact(self):
+        """
+        Returns False if the blob's size doesn't match the saved offsets, i.e. a save was
+        interrupted between writing the texts and replacing the offsets.
+        """
+        size = os.path.getsize(self.texts_path) if os.path.exists(self.texts_path) else 0
+        return size == int(self._offsets[-1])
+
+    def save(self):
+        """
+        Appends entries added since the last save to the blob and rewrites the offsets.
+        """
+        if not self._pending:
+            return
+        encoded = [text.encode('utf-8') for text in self._pending]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.concatenate((self._offsets, self._offsets[-1] + np.cumsum(lengths)))
+        end = int(self._offsets[-1])
+        # Release the maps before writing so the files can be extended/replaced on any OS
+        self._offsets = self._texts = None
+        with open(self.texts_path, 'ab') as f:
+            # A save interrupted before its offsets were replaced leaves bytes past the last
+            # saved entry; new texts must start exactly where the offsets say
+            f.truncate(end)
+            f.write(b''.join(encoded))
+        # The offsets decide which bytes of the blob are live, so they are swapped in whole
+        tmp_path = self.offsets_path + '.tmp'
+        offsets.tofile(tmp_path)
+        os.replace(tmp_path, self.offsets_path)
+        self._pending = []
+        self._load()
+
+class MappedVectors:
+    """
+    Growable float32 matrix of width dim kept in a memory-mapped file at path. The file
+    is preallocated and doubled when full, so new rows are written straight into the map.
+    The number of valid rows is saved beside it (<path>.rows), since the file's size
+    only tells its capacity.
+    """
+    def __init__(self, path, dim):
+        self.path = path
+        self.rows_path = path + '.rows'
+        self.dim = dim
+        self._length = int(np.fromfile(self.rows_path, dtype=np.int64)[0]) if os.path.exists(self.rows_path) else 0
+        self._map = None
+        self.capacity = 0
+        if os.path.exists(path):
+            self._open(os.path.getsize(path) // (4 * dim))
+
+    def _open(self, capacity):
+        # Release the current map before resizing so the file can be extended on any OS
+        self._map = None
+        with open(self.path, 'ab') as f:
+            if f.tell() < capacity * 4 * self.dim:
+                f.truncate(capacity * 4 * self.dim)
+        self.capacity = capacity
+        if capacity:
+            self._map = np.memmap(self.path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def __len__(self):
+        return self._length
+
+    def extend(self, rows):
+        end = self._length + len(rows)
+        if end > self.capacity:
+            self._open(max(end, 2 * self.capacity, _MIN_VECTOR_CAPACITY))
+        self._map[self._length:end] = rows
+        self._length = end
+
+    def rows(self):
+        """
+        Returns all rows as one (len(self), dim) array backed by the map.
+        """
+        if self._map is None:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return self._map[:self._length]
+
+    def take(self, ids):
+        """
+        Returns the rows at the given indices as an array.
+        """
+        return self.rows()[ids]
+
+    def save(self):
+        if self._map is not None:
+            self._map.flush()
+        tmp_path = self.rows_path + '.tmp'
+        np.array([self._length], dtype=np.int64).tofile(tmp_path)
+        os.replace(tmp_path, self.rows_path)
 
 class FaissVectorStore:
-    def __init__(self, dim, index_path='faiss.index', meta_path='faiss_meta.pkl'):
+    def __init__(self, dim, index_path='faiss.index', meta_path='faiss_meta', quantization='bf16', index_type='flat', use_gpu=False, flush_every=1, rerank=False):
+        """
+        quantization selects how vectors are stored: 'bf16' (default) halves memory while
+        keeping the FP32 exponent range and needs no training, 'fp16' does the same with
+        less range, 'sq8' keeps one byte per dimension and 'sq4' half a byte (both trained
+        on the first add), and 'fp32' keeps full-precision vectors.
+        Vectors are L2-normalized and compared by inner product, i.e. cosine similarity.
+        Chunk texts are persisted next to the index as meta_path.texts/meta_path.offsets
+        and memory-mapped on load (see MappedTextList), as are the index's vectors.
+        index_type='ivfpq' switches to an IVF-PQ index once the corpus is large enough to
+        train it, so queries scan only nprobe cells of compressed codes;
+        index_type='ivfpq_fastscan' does the same with 4-bit codes scored by SIMD table
+        lookups. quantization is ignored for both. index_type='hnsw' builds an HNSW graph
+        over the (quantized) vectors, visiting ~log N nodes per query.
+        rerank=True also keeps the normalized FP32 vectors in index_path.vectors and
+        rescores a wider candidate set from the index with them, so compressed indexes
+        return the exact top_k order.
+        use_gpu=True searches a copy of the index on GPU 0 when faiss-gpu and a GPU are
+        available; the CPU index stays the one that is added to and saved.
+        add() and remove() write the index and texts to disk every flush_every calls (by
+        default on every call). Inside a `with store:` block nothing is written until the
+        block exits cleanly, which then writes everything once; flush() writes out
+        whatever is pending at any time.
+        """
+        _configure_faiss()
         self.dim = dim
+        self.index_type = index_type
+        # Searches share the read side, so concurrent queries (e.g. RAGPipeline.aanswer_queries)
+        # run in parallel; add/remove/save take the write side, since they swap the index and
+        # remap the text and vector files that searches read.
+        self._lock = _ReadWriteLock()
+        # Guards the lazily built GPU copy, which searches create under the read side
+        self._gpu_lock = threading.Lock()
+        self.flush_every = flush_every
+        # add()/remove() calls since the index was last written
+        self._unsaved = 0
+        # Open `with store:` blocks; writes are deferred while any is open
+        self._batch_depth = 0
         self.index_path = index_path
         self.meta_path = meta_path
+        self.meta = MappedTextList(meta_path)
+        self.vectors = MappedVectors(index_path + '.vectors', dim) if rerank else None
+        if self.vectors is not None and len(self.vectors) != len(self.meta):
+            # e.g. texts added while the store was opened without rerank=True
+            print("[DEBUG] Stored FP32 vectors don't match the index; reranking disabled")
+            self.vectors = None
+        # A mapped index can be searched but not grown; add() swaps in an owned copy first
+        self._mapped = False
         if os.path.exists(index_path):
-            self.index = faiss.read_index(index_path)
-            with open(meta_path, 'rb') as f:
-                self.meta = pickle.load(f)
+            self.index = faiss.read_index(index_path, _MMAP_FLAG)
+            self._mapped = True
         else:
-            self.index = faiss.IndexFlatL2(dim)
-            self.meta = []
+            self.index = _build_index(dim, quantization, index_type)
+        if use_gpu and not _gpu_available():
+            print("[DEBUG] use_gpu requested but no faiss GPU support found; searching on CPU")
+        self.use_gpu = use_gpu and _gpu_available()
+        self._gpu_resources = faiss.StandardGpuResources() if self.use_gpu else None
+        # GPU copy of self.index, rebuilt lazily after adds
+        self._gpu_index = None
 
     def add(self, embeddings, metadatas):
-        arr = np.array(embeddings).astype('float32')
-        self.index.add(arr)
-        self.meta.extend(metadatas)
-        self.save()
-
-    def search(self, query_embedding, top_k=5):
-        arr = np.array([query_embedding]).astype('float32')
-        D, I = self.index.search(arr, top_k)
-        results = [self.meta[i] for i in I[0]]
+        """
+        Adds embeddings with their metadata. Callers adding in several steps should do so
+        inside a `with store:` block so the store is written once at the end.
+        """
+        # Own copy, since normalize_L2 works in place and callers may reuse their array
+        arr = self._check_dim(np.array(embeddings, dtype=np.float32, order='C', ndmin=2))
+        faiss.normalize_L2(arr)
+        with self._lock.write():
+            if self._mapped:
+                self.index = faiss.read_index(self.index_path)
+                self._mapped = False
+            if not self.index.is_trained:
+                # Scalar quantizers learn per-dimension value ranges from the first batch
+                self.index.train(arr)
+            if isinstance(self.index, (faiss.IndexIDMap, faiss.IndexIVF)):
+                # Ids are positions in self.meta, so search results still index the texts even
+                # after remove() has made ntotal smaller than len(self.meta)
+                start = len(self.meta)
+                self.index.add_with_ids(arr, np.arange(start, start + len(arr), dtype=np.int64))
+            else:
+                self.index.add(arr)
+            self._gpu_index = None
+            if self.index_type in _IVF_INDEX_TYPES:
+                self._maybe_build_ivfpq()
+            self.meta.extend(metadatas)
+            if self.vectors is not None:
+                self.vectors.extend(arr)
+            self._changed()
+
+    def remove(self, ids):
+        """
+        Removes the vectors with the given row indices from the index so searches no longer
+        return them; their texts stay in meta, so the remaining indices are unchanged.
+        Returns the number of vectors removed. Supported for flat and IVF-PQ stores.
+        Written to disk on the same flush_every schedule as add().
+        """
+        with self._lock.write():
+            if not isinstance(self.index, (faiss.IndexIDMap, faiss.IndexIVF)):
+                # IndexFlat would renumber the vectors after the removed ones, and HNSW
+                # graphs cannot drop nodes at all
+                raise ValueError(f"{type(self.index).__name__} does not support removing vectors.")
+            if self._mapped:
+                self.index = faiss.read_index(self.index_path)
+                self._mapped = False
+            removed = self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+            self._gpu_index = None
+            self._changed()
+            return removed
+
+    def _changed(self):
+        # Counts a write and saves once flush_every of them are pending, unless a `with`
+        # block is deferring writes; caller holds the write lock
+        self._unsaved += 1
+        if not self._batch_depth and self._unsaved >= self.flush_every:
+            self._save()
+
+    def _check_dim(self, arr):
+        # FAISS reads raw rows of self.dim floats; a wrong width would silently misalign them
+        if arr.ndim != 2 or arr.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got array of shape {arr.shape}.")
+        return arr
+
+    def _maybe_build_ivfpq(self):
+        n = self.index.ntotal
+        nlist = _ivf_nlist(n)
+        if isinstance(self.index, faiss.IndexIVF) or n < _IVF_POINTS_PER_CELL * nlist:
+            return
+        vectors = self.index.reconstruct_n(0, n)
+        quantizer = faiss.IndexFlatIP(self.dim)
+        if self.index_type == 'ivfpq_fastscan':
+            index = faiss.IndexIVFPQFastScan(quantizer, self.dim, nlist, _pq_m(self.dim), _FASTSCAN_NBITS, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, self.dim, nlist, _pq_m(self.dim), _PQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.add(vectors)
+        index.nprobe = _IVF_NPROBE
+        self.index = index
+
+    def _search_index(self):
+        if not self.use_gpu:
+            return self.index
+        with self._gpu_lock:
+            if self._gpu_index is None:
+                try:
+                    self._gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, self.index)
+                except RuntimeError as e:
+                    # e.g. HNSW and flat scalar-quantizer indexes have no GPU implementation
+                    print(f"[DEBUG] Index cannot be moved to GPU ({e}); searching on CPU")
+                    self.use_gpu = False
+                    return self.index
+            return self._gpu_index
+
+    def search_ids(self, query_embedding, top_k=5, exact=False):
+        """
+        Returns the row indices of the top_k nearest stored vectors, best first. FAISS pads
+        with -1 when fewer than top_k vectors exist; those are dropped.
+        exact=True scores every stored FP32 vector instead (needs rerank=True).
+        """
+        return self.search_batch_ids([query_embedding], top_k, exact)[0]
+
+    def search_batch_ids(self, query_embeddings, top_k=5, exact=False):
+        """
+        Like search_ids for several queries at once: one FAISS call (a single matrix product
+        for flat indexes) returns a list of index lists, one per query.
+        """
+        arr = self._queries(query_embeddings)
+        with self._lock.read():
+            return self._search_ids(arr, top_k, exact)
+
+    def _queries(self, query_embeddings):
+        # Exactly one copy: normalize_L2 works in place and embed_query vectors are read-only
+        arr = self._check_dim(np.array(query_embeddings, dtype=np.float32, order='C', ndmin=2))
+        faiss.normalize_L2(arr)
+        return arr
+
+    def _search_ids(self, arr, top_k, exact):
+        # Caller holds the read lock
+        if exact or self._small_exact():
+            return self._exact_search_ids(arr, top_k)
+        index = self._search_index()
+        k = top_k * _RERANK_CANDIDATES if self.vectors is not None else top_k
+        if isinstance(index, faiss.IndexHNSW):
+            # Widen the candidate list with k; passed per call so concurrent searches
+            # don't race on index.hnsw.efSearch
+            params = faiss.SearchParametersHNSW(efSearch=max(k * 4, _HNSW_EF_SEARCH))
+            D, I = index.search(arr, k, params=params)
+        else:
+            D, I = index.search(arr, k)
+        if self.vectors is None:
+            return [[int(i) for i in row if i >= 0] for row in I]
+        return [self._rerank(query, row[row >= 0], top_k) for query, row in zip(arr, I)]
+
+    def _small_exact(self):
+        # For a couple hundred vectors one GEMM over the FP32 rows beats a FAISS call, and the
+        # result is exact; only valid while no vectors have been removed
+        n = self.index.ntotal
+        return self.vectors is not None and n < _SMALL_N_THRESHOLD and len(self.vectors) == n
+
+    def _exact_search_ids(self, queries, top_k):
+        if self.vectors is None or len(self.vectors) != self.index.ntotal:
+            # Removed vectors are still in the FP32 file, so it can't be scanned blindly
+            raise ValueError("Exact search needs rerank=True and a store with no removed vectors.")
+        vectors = self.vectors.rows()
+        k = min(top_k, len(vectors))
+        if k == 0:
+            return [[] for _ in queries]
+        # Vectors are unit length, so the inner product is the whole cosine score and the
+        # scan is a single SGEMM; argpartition then avoids sorting every score
+        scores = queries @ vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row_scores, row_top in zip(scores, top):
+            order = np.argsort(-row_scores[row_top], kind='stable')
+            results.append([int(i) for i in row_top[order]])
         return results
 
+    def _rerank(self, query, candidates, top_k):
+        # Exact cosine scores of the candidates: one (k, dim) x (dim,) product
+        scores = self.vectors.take(candidates) @ query
+        order = np.argsort(-scores, kind='stable')[:top_k]
+        return [int(i) for i in candidates[order]]
+
+    def search(self, query_embedding, top_k=5, exact=False):
+        """
+        Returns (index, metadata) pairs for the top_k nearest stored vectors, best first.
+        """
+        return self.search_batch([query_embedding], top_k, exact)[0]
+
+    def search_batch(self, query_embeddings, top_k=5, exact=False):
+        """
+        Returns one list of (index, metadata) pairs per query, from a single FAISS call.
+        """
+        arr = self._queries(query_embeddings)
+        with self._lock.read():
+            return [list(zip(row, self.meta.take(row))) for row in self._search_ids(arr, top_k, exact)]
+
     def save(self):
-        faiss.write_index(self.index, self.index_path)
-        with open(self.meta_path, 'wb') as f:
-            pickle.dump(self.meta, f) 
\ No newline at end of file
+        with self._lock.write():
+            self._save()
+
+    def flush(self):
+        """
+        Writes the store to disk if anything was added since it was last saved.
+        """
+        with self._lock.write():
+            if self._unsaved:
+                self._save()
+
+    def __enter__(self):
+        with self._lock.write():
+            self._batch_depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Only a completed batch of adds is written; after an error the files on disk keep
+        # their last consistent state
+        with self._lock.write():
+            self._batch_depth -= 1
+            if exc_type is None and not self._batch_depth and self._unsaved:
+                self._save()
+
+    def _save(self):
+        # Vectors are flushed before the texts, whose count decides how many rows are valid
+        if self.vectors is not None:
+            self.vectors.save()
+        self.meta.save()
+        # The index goes last and marks the save complete: a crash before the rename leaves
+        # the old index, which then holds fewer vectors than meta has texts. It is written
+        # beside the old file and renamed over it, so it is never seen half-written and
+        # readers that mapped the old file keep a valid copy.
+        tmp_path = self.index_path + '.tmp'
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+        self._unsaved = 0 
\ No newline at end of file